@@ -7,15 +7,17 @@ import numpy
 import os
 import pylab
 from MyExceptions import Hell, TheDead, Hope, InputError, StupidError, Cthulhu
+from RandomStreams import get_rng, randint
 
 class SimuIma:
     """
     This class simulates astronomical images, including adding psfs, background, noise.
     Created images allow to practice photometry.
     """
-    def __init__(self, size=(400, 600)):
+    def __init__(self, size=(400, 600), rng=None):
         """
         :param size: size of the created image
+        :param rng: random generator or seed used for all random draws, default is the global numpy.random state
         """
         self._ima = numpy.zeros(size) #Initialize image
         self._size = size
@@ -29,6 +31,7 @@ class SimuIma:
         self._lock = False
         self._practicemode = False
         self._practicedict = {}
+        self._rng = get_rng(rng)
 
     def add_bg(self, level):
         """
@@ -68,7 +71,7 @@ class SimuIma:
         if self._lock:
             raise InputError('Oi! This image has been locked.')
         else:
-            self._realima = numpy.random.poisson(self._ima*scale)
+            self._realima = self._rng.poisson(self._ima*scale)
             self._history.append('Shot noise added scale = %s' %scale)
 
     def add_ron(self, std):
@@ -80,7 +83,7 @@ class SimuIma:
         if self._lock:
             raise InputError('Oi! This image has been locked.')
         else:
-            self._realima += numpy.random.poisson(std, size=self._size)
+            self._realima += self._rng.poisson(std, size=self._size)
             self._history.append('RON added std = %s' % std)
 
     def write(self, filename, raw=False):
@@ -158,9 +161,18 @@ class SimuIma:
     def get_data(self):
         return self._realima
 
+    def get_practicedict(self):
+        """
+        Ground truth of the practice image: psf positions and fluxes, sigma, background and noise
+        :return: copy of the practice dictionary
+        """
+        if self._practicemode is False:
+            raise StupidError("Oi! you don't have a practice image.")
+        return dict(self._practicedict)
+
 
     def practiceima(self, npsf=2, psffluxrange=[500, 1000], bgrange=[2, 10], sigmarange=[3, 6], ronrange=[1, 10],
-                    shot=True, ron=True, edge=0.1):
+                    shot=True, ron=True, edge=0.1, show=True):
         """
         Create a random practice image.
         :param npsf: number of objects added
@@ -171,6 +183,7 @@ class SimuIma:
         :param shot: add shot noise? (Boolean)
         :param ron: add RON? (bolean)
         :param edge: edge of frame left out of placement of PSFs
+        :param show: show the image once it is made
         :return:
         """
         #Need to add sanity checks for the inputs
@@ -180,7 +193,7 @@ class SimuIma:
             raise InputError('psffluxrange needs to be of length 2')
         if len(bgrange) != 2:
             raise InputError('bgrange needs to be of length 2')
-        if len(fwhmrange) != 2:
+        if len(sigmarange) != 2:
             raise InputError('sigmarange needs to be of length 2')
         if len(ronrange) != 2:
             raise InputError('ronrange needs to be of length 2')
@@ -201,14 +214,14 @@ class SimuIma:
         self._practicedict['psf_y'] = []
         self._practicedict['psf_flux'] = []
         #get FWHM value and store
-        fwhm = numpy.random.uniform(sigmarange[0], sigmarange[1], 1)[0]
+        sigma = self._rng.uniform(sigmarange[0], sigmarange[1], 1)[0]
         self._practicedict['sigma'] = sigma
         #add PSFs, looping
         for i in range(npsf):
             #create random values for instance of this PSF
-            x = numpy.random.uniform(edge*self._size[0], (1-edge)*self._size[0], 1)[0]
-            y = numpy.random.uniform(edge*self._size[1], (1-edge)*self._size[1], 1)[0]
-            flux = numpy.random.uniform(psffluxrange[0], psffluxrange[1], 1)[0]
+            x = self._rng.uniform(edge*self._size[0], (1-edge)*self._size[0], 1)[0]
+            y = self._rng.uniform(edge*self._size[1], (1-edge)*self._size[1], 1)[0]
+            flux = self._rng.uniform(psffluxrange[0], psffluxrange[1], 1)[0]
             #add PSF
             self.addPSF(x, y, sigma, flux)
             #store PSF
@@ -216,29 +229,31 @@ class SimuIma:
             self._practicedict['psf_y'].append(y)
             self._practicedict['psf_flux'].append(flux)
         #add bg
-        bg = numpy.random.uniform(bgrange[0], bgrange[1], 1)[0]
+        bg = self._rng.uniform(bgrange[0], bgrange[1], 1)[0]
         self._practicedict['bg'] = bg
         self.add_bg(bg)
         #add noise
+        #shot noise first, it replaces the noisy image, RON is then added on top of it
+        if shot:
+            self._practicedict['shotflag'] = shot
+            self.add_shot(1)
+        else:
+            self._practicedict['shotflag'] = shot
+            self._realima = self._ima.copy()
         #RON
         if ron:
-            ron = numpy.random.uniform(ronrange[0], ronrange[1], 1)[0]
+            ron = self._rng.uniform(ronrange[0], ronrange[1], 1)[0]
             self._practicedict['ron'] = ron
             self._practicedict['ronflag'] = ron
             self.add_ron(ron)
         else:
             self._practicedict['ronflag'] = ron
-        #add shot noise, if requested
-        if shot:
-            self._practicedict['shotflag'] = shot
-            self.add_shot(1)
-        else:
-            self._practicedict['shotflag'] = shot
         #locking the image
         self._practicemode = True
         self._lock = True
         #showing the image
-        self.show_ima()
+        if show:
+            self.show_ima()
 
 
     def explain_practiceima(self):
@@ -332,29 +347,31 @@ class SimuIma:
 
 
 class centred_psf_highSN(SimuIma):
-    def __init__(self, size=(50, 50)):
+    def __init__(self, size=(50, 50), rng=None):
         """
         :param size:
+        :param rng:
         """
-        SimuIma.__init__(self, size=size)
+        SimuIma.__init__(self, size=size, rng=rng)
         self.practiceima(npsf=1, edge=0.45, psffluxrange=[5000, 50000], bgrange=[1,5], sigmarange=[3,6], ronrange=[1, 5])
         print("This class will simulate a single PSF in the centre of the field with high SN. RON is %.2f" % self._practicedict['ron'])
 
 
 class centred_psf_lowSN(SimuIma):
-    def __init__(self, size=(50, 50)):
+    def __init__(self, size=(50, 50), rng=None):
         """
         :param size:
+        :param rng:
         """
-        SimuIma.__init__(self, size=size)
+        SimuIma.__init__(self, size=size, rng=rng)
         self.practiceima(npsf=1, edge=0.45, psffluxrange=[500, 2000], bgrange=[1,5], sigmarange=[3,6], ronrange=[1, 5])
         print("This class will simulate a single PSF in the centre of the field with low SN. RON is %.2f" % self._practicedict['ron'])
 
 
 class crowded_field(SimuIma):
-    def __init__(self, size=(100, 100)):
-        SimuIma.__init__(self, size=size)
-        self.npsf = numpy.random.randint(5, 10)
+    def __init__(self, size=(100, 100), rng=None):
+        SimuIma.__init__(self, size=size, rng=rng)
+        self.npsf = randint(self._rng, 5, 10)
         self.practiceima(npsf=self.npsf, edge=0.05, psffluxrange=[4000, 10000], bgrange=[1, 5], sigmarange=[3, 6], ronrange=[1, 5])
         print("A crowded field with several psfs. RON is %.2f" % self._practicedict['ron'])
     def show_objectnumber(self):
@@ -366,8 +383,8 @@ class tutorial_image(SimuIma):
     """
     The tutorial image, hidden from the students, he he he.
     """
-    def __init__(self):
-        SimuIma.__init__(self, size=(50,50))
+    def __init__(self, rng=None):
+        SimuIma.__init__(self, size=(50,50), rng=rng)
         self.addPSF(20, 20, 2, 5000)
         self.addPSF(30, 30, 2, 400)
         self.add_bg(20)
@@ -378,8 +395,8 @@ class calibrate_object(SimuIma):
     """
     Simulates a standard star and object with random sky background random fluxes in both sources
     """
-    def __init__(self, size=(75, 75)):
-        SimuIma.__init__(self, size=size)
+    def __init__(self, size=(75, 75), rng=None):
+        SimuIma.__init__(self, size=size, rng=rng)
         self.practiceima(npsf=2, edge=0.25, psffluxrange=[5000, 10000], bgrange=[1, 5], sigmarange=[3, 6], ronrange=[1, 5])
         self.explain_calib()
         raise Hope("this needs scaling")
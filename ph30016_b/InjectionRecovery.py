@@ -0,0 +1,340 @@
+"""
+Supporting code for PH30116 - Data analysis and research methods in observational astrophysics - University of Bath
+InjectionRecovery injects synthetic transits into real Kepler quarters to measure detection completeness
+"""
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy
+import pandas as pd
+from astropy.io import fits
+from astropy.timeseries import BoxLeastSquares
+from scipy.signal import savgol_filter
+from MyExceptions import InputError, StupidError
+from RandomStreams import stream
+
+RESULT_COLUMNS = ['trial', 'period', 't0', 'depth', 'duration',
+                  'found_period', 'found_t0', 'found_depth', 'found_snr', 'recovered', 'alias']
+#period ratios logged as aliases when the search locks onto a harmonic of the injection
+ALIASES = (1. / 3, 0.5, 2., 3.)
+
+#Base arrays of the worker process, opened read-only from the campaign directory
+_base = {}
+
+
+def load_kepler_quarters(datadir):
+    """
+    Reads all quarters of an object, normalises each one by its mean flux and stitches them in time order.
+    :param datadir: directory holding the kplr*.fits files, i.e. Data/Object1lc
+    :return: time, flux, error, segments (start, stop index of each quarter)
+    """
+    files = glob.glob(os.path.join(datadir, 'kplr*.fits'))
+    if not files:
+        raise InputError('No kplr*.fits files found in %s' % datadir)
+    quarters = []
+    for lcfile in files:
+        with fits.open(lcfile) as tmp:
+            t = numpy.array(tmp[1].data['TIME'], dtype=float)
+            f = numpy.array(tmp[1].data['PDCSAP_FLUX'], dtype=float)
+            e = numpy.array(tmp[1].data['PDCSAP_FLUX_ERR'], dtype=float)
+        mask = numpy.isfinite(t) & numpy.isfinite(f) & numpy.isfinite(e)
+        if not mask.any():
+            continue
+        norm = numpy.mean(f[mask])
+        quarters.append((t[mask], f[mask] / norm, e[mask] / norm))
+    quarters.sort(key=lambda q: q[0][0])
+    time = numpy.concatenate([q[0] for q in quarters])
+    flux = numpy.concatenate([q[1] for q in quarters])
+    error = numpy.concatenate([q[2] for q in quarters])
+    stops = numpy.cumsum([len(q[0]) for q in quarters])
+    segments = numpy.stack((stops - [len(q[0]) for q in quarters], stops), axis=1)
+    return time, flux, error, segments
+
+
+def box_transits(time, period, t0, depth, duration):
+    """
+    Box shaped transit models for a batch of parameter sets, evaluated on a shared time array.
+    :param time: time array of length n
+    :param period, t0, depth, duration: arrays of length b (same unit as time for all but depth)
+    :return: (b, n) array of relative flux
+    """
+    period = numpy.asarray(period, dtype=float)[:, None]
+    t0 = numpy.asarray(t0, dtype=float)[:, None]
+    phase = (time[None, :] - t0 + 0.5 * period) % period - 0.5 * period
+    intransit = numpy.abs(phase) < 0.5 * numpy.asarray(duration, dtype=float)[:, None]
+    return 1. - numpy.asarray(depth, dtype=float)[:, None] * intransit
+
+
+def mask_transits(time, ephemerides):
+    """
+    Mask of the points outside the transits of known planets.
+    :param time: time array
+    :param ephemerides: list of (period, t0, duration), same unit as time
+    :return: boolean mask of points to keep
+    """
+    keep = numpy.ones(numpy.shape(time), dtype=bool)
+    for period, t0, duration in ephemerides:
+        phase = (time - t0 + 0.5 * period) % period - 0.5 * period
+        keep &= numpy.abs(phase) >= 0.5 * duration
+    return keep
+
+
+def detrend_batch(flux, segments, window=271, polyorder=3):
+    """
+    Divides each row by a Savitzky-Golay fit, quarter by quarter so the filter never runs across gaps.
+    :param flux: (b, n) array, modified in place
+    :param segments: (start, stop) index of each quarter
+    :param window: filter window length in points
+    :param polyorder: order of the filter polynomial
+    :return: flux
+    """
+    for start, stop in segments:
+        w = min(window, stop - start)
+        w -= 1 - w % 2 #window must be odd
+        if w <= polyorder:
+            continue
+        flux[:, start:stop] /= savgol_filter(flux[:, start:stop], window_length=w, polyorder=polyorder, axis=-1)
+    return flux
+
+
+def clip_batch(flux, num_sigma=2):
+    """
+    Mask of points below mean + num_sigma * std of each row, the upper clip used in the notebooks.
+    :param flux: (b, n) array
+    :param num_sigma: clipping threshold
+    :return: (b, n) boolean mask of points to keep
+    """
+    upper = numpy.mean(flux, axis=1) + num_sigma * numpy.std(flux, axis=1)
+    return flux < upper[:, None]
+
+
+def _init_worker(workdir):
+    """
+    Opens the base arrays once per worker process, memory mapped and read-only, so all workers share one copy.
+    """
+    for name in ('time', 'flux', 'error', 'segments'):
+        _base[name] = numpy.load(os.path.join(workdir, '%s.npy' % name), mmap_mode='r')
+
+
+def _run_batch(params, config):
+    """
+    Injects, detrends, clips and searches one batch of trials inside a worker.
+    :param params: dict of equal length arrays (trial, period, t0, depth, duration)
+    :param config: search settings of the campaign
+    :return: list of result rows
+    """
+    time, error = _base['time'], _base['error']
+    #the only per-batch allocation, the base arrays are never written to
+    flux = box_transits(time, params['period'], params['t0'], params['depth'], params['duration'])
+    flux *= _base['flux']
+    detrend_batch(flux, _base['segments'], config['window'], config['polyorder'])
+    keep = clip_batch(flux, config['num_sigma'])
+    periods = numpy.asarray(config['periods'])
+    rows = []
+    for i in range(len(flux)):
+        m = keep[i]
+        bls = BoxLeastSquares(time[m], flux[i, m], error[m])
+        res = bls.power(periods, config['durations'])
+        best = numpy.argmax(res.power)
+        p, t0 = params['period'][i], params['t0'][i]
+        fp, ft0 = res.period[best], res.transit_time[best]
+        #compare the found transit closest to the middle of the data, where period errors drift the least
+        tmid = ft0 + numpy.round((0.5 * (time[0] + time[-1]) - ft0) / fp) * fp
+        offset = abs((tmid - t0 + 0.5 * p) % p - 0.5 * p)
+        #a peak below the detection threshold wouldn't survive a real search, whatever its period
+        detected = res.depth_snr[best] >= config['min_snr']
+        recovered = detected and abs(fp - p) / p < config['period_tol'] and offset < params['duration'][i]
+        alias = [a for a in ALIASES if detected and abs(fp - a * p) / (a * p) < config['period_tol']]
+        rows.append([int(params['trial'][i]), p, t0, params['depth'][i], params['duration'][i],
+                     fp, ft0, res.depth[best], res.depth_snr[best], bool(recovered),
+                     alias[0] if alias else numpy.nan])
+    return rows
+
+
+class InjectionCampaign:
+    """
+    Injection-recovery campaign on a real lightcurve.
+    Trials are drawn from per-trial seeds, run in batches over a process pool and appended to
+    results.csv in the campaign directory as they finish, so an interrupted campaign can be resumed.
+    Known planets of the host star are masked out of the base data, otherwise the search keeps finding
+    them instead of the injections.
+    """
+    def __init__(self, time, flux, error, workdir, segments=None, periodrange=(1., 40.), depthrange=(1e-4, 1e-2),
+                 durationrange=(0.05, 0.3), periods=None, durations=(0.05, 0.1, 0.2, 0.3), window=271, polyorder=3,
+                 num_sigma=2, period_tol=0.01, min_snr=7., seed=0, ephemerides=()):
+        """
+        :param time: time array in days
+        :param flux: normalised flux
+        :param error: flux error
+        :param workdir: campaign directory, holds the base arrays and the streamed results
+        :param segments: (start, stop) index of each quarter, default is one segment
+        :param periodrange: range of injected periods, drawn log-uniform
+        :param depthrange: range of injected depths, drawn log-uniform
+        :param durationrange: range of injected durations, drawn uniform
+        :param periods: BLS period grid, default is 20000 log spaced periods over periodrange
+        :param durations: BLS trial durations
+        :param window: Savitzky-Golay window length
+        :param polyorder: Savitzky-Golay polynomial order
+        :param num_sigma: upper clipping threshold
+        :param period_tol: relative period tolerance for a recovery
+        :param min_snr: detection threshold on the BLS depth signal to noise, weaker peaks are neither
+            recovered nor aliases
+        :param seed: campaign seed, trial i always gets the same parameters
+        :param ephemerides: list of (period, t0, duration) of known planets, their transits are dropped
+            a planet with timing variations needs a wider duration or one entry per ephemeris branch
+        """
+        if numpy.shape(time) != numpy.shape(flux) or numpy.shape(time) != numpy.shape(error):
+            raise InputError("Shape of time, flux and error must match, but is %s, %s and %s"
+                             % (numpy.shape(time), numpy.shape(flux), numpy.shape(error)))
+        if min(durations) <= 0 or max(durations) >= periodrange[0]:
+            raise InputError('durations need to be positive and shorter than the shortest period')
+        self._time = numpy.ascontiguousarray(time, dtype=float)
+        self._flux = numpy.ascontiguousarray(flux, dtype=float)
+        self._error = numpy.ascontiguousarray(error, dtype=float)
+        if segments is None:
+            segments = [(0, len(self._time))]
+        self._segments = numpy.asarray(segments, dtype=int)
+        self._workdir = workdir
+        self._resultfile = os.path.join(workdir, 'results.csv')
+        self._periodrange = periodrange
+        self._depthrange = depthrange
+        self._durationrange = durationrange
+        self._seed = seed
+        if periods is None:
+            periods = numpy.exp(numpy.linspace(numpy.log(periodrange[0]), numpy.log(periodrange[1]), 20000))
+        self._ephemerides = [list(map(float, eph)) for eph in ephemerides]
+        self._config = {'periods': list(numpy.asarray(periods, dtype=float)), 'durations': list(durations),
+                        'window': window, 'polyorder': polyorder, 'num_sigma': num_sigma, 'period_tol': period_tol,
+                        'min_snr': min_snr}
+
+    @classmethod
+    def from_kepler(cls, datadir, workdir, **kwargs):
+        """
+        Campaign on all quarters of a Kepler object, i.e. Data/Object1lc
+        """
+        time, flux, error, segments = load_kepler_quarters(datadir)
+        return cls(time, flux, error, workdir, segments=segments, **kwargs)
+
+    def trial_parameters(self, trials):
+        """
+        Draws the injected parameters, each trial from its own seed so the draw doesn't depend on batching.
+        :param trials: trial numbers
+        :return: dict of arrays (trial, period, t0, depth, duration)
+        """
+        params = {'trial': numpy.asarray(trials, dtype=int)}
+        draws = []
+        for trial in params['trial']:
+            draws.append(stream(self._seed, trial, 'injection').uniform(size=4))
+        draws = numpy.array(draws).reshape(-1, 4)
+        lp, ld = numpy.log(self._periodrange), numpy.log(self._depthrange)
+        params['period'] = numpy.exp(lp[0] + draws[:, 0] * (lp[1] - lp[0]))
+        params['t0'] = self._time[0] + draws[:, 1] * params['period']
+        params['depth'] = numpy.exp(ld[0] + draws[:, 2] * (ld[1] - ld[0]))
+        params['duration'] = self._durationrange[0] + draws[:, 3] * (self._durationrange[1] - self._durationrange[0])
+        return params
+
+    def _prepare(self):
+        """
+        Writes the base arrays for the workers, without the transits of known planets,
+        and checks the directory belongs to this campaign.
+        """
+        if not os.path.isdir(self._workdir):
+            os.makedirs(self._workdir)
+        checksum = hashlib.sha1()
+        for arr in (self._time, self._flux, self._error, self._segments):
+            checksum.update(arr.tobytes())
+        config = dict(self._config)
+        config['periods'] = hashlib.sha1(numpy.asarray(config['periods']).tobytes()).hexdigest()
+        setup = {'seed': self._seed, 'periodrange': list(self._periodrange), 'depthrange': list(self._depthrange),
+                 'durationrange': list(self._durationrange), 'n': len(self._time), 'data': checksum.hexdigest(),
+                 'config': config, 'ephemerides': self._ephemerides, 'stream': 'injection'}
+        setup = json.loads(json.dumps(setup))
+        setupfile = os.path.join(self._workdir, 'campaign.json')
+        if os.path.isfile(setupfile):
+            with open(setupfile) as f:
+                if json.load(f) != setup:
+                    raise StupidError('Oi! %s holds a different campaign.' % self._workdir)
+        else:
+            with open(setupfile, 'w') as f:
+                json.dump(setup, f)
+        keep = mask_transits(self._time, self._ephemerides)
+        #segment boundaries in the kept points, quarters left empty are dropped
+        kept = numpy.concatenate(([0], numpy.cumsum(keep)))[self._segments]
+        segments = kept[kept[:, 1] > kept[:, 0]]
+        for name, arr in (('time', self._time[keep]), ('flux', self._flux[keep]), ('error', self._error[keep]),
+                          ('segments', segments)):
+            numpy.save(os.path.join(self._workdir, '%s.npy' % name), arr)
+
+    def done_trials(self):
+        """
+        Trial numbers already in results.csv
+        """
+        if not os.path.isfile(self._resultfile):
+            return set()
+        return set(pd.read_csv(self._resultfile, usecols=['trial'])['trial'])
+
+    def run(self, ntrials, nworkers=None, batchsize=16, verbose=False):
+        """
+        Runs trials 0 to ntrials-1, skipping the ones already done.
+        :param ntrials: total number of trials in the campaign
+        :param nworkers: number of worker processes, default is one per cpu
+        :param batchsize: trials injected together on one worker
+        :param verbose: print progress
+        :return: results table
+        """
+        if type(batchsize) is not int or batchsize <= 0:
+            raise InputError('batchsize needs to be a positive integer')
+        self._prepare()
+        done = self.done_trials()
+        todo = [i for i in range(ntrials) if i not in done]
+        if not os.path.isfile(self._resultfile):
+            with open(self._resultfile, 'w') as f:
+                f.write(','.join(RESULT_COLUMNS) + '\n')
+        with ProcessPoolExecutor(max_workers=nworkers, initializer=_init_worker,
+                                 initargs=(self._workdir,)) as pool:
+            futures = [pool.submit(_run_batch, self.trial_parameters(todo[i:i + batchsize]), self._config)
+                       for i in range(0, len(todo), batchsize)]
+            finished = 0
+            for future in as_completed(futures):
+                rows = future.result()
+                #stream every batch to disk straight away, this is what makes the campaign resumable
+                pd.DataFrame(rows, columns=RESULT_COLUMNS).to_csv(self._resultfile, mode='a', header=False,
+                                                                 index=False)
+                finished += len(rows)
+                if verbose:
+                    print('%i/%i trials done' % (finished, len(todo)))
+        return self.results()
+
+    def results(self):
+        """
+        All finished trials, sorted by trial number.
+        """
+        if not os.path.isfile(self._resultfile):
+            raise StupidError("Oi! this campaign hasn't been run yet.")
+        return pd.read_csv(self._resultfile).drop_duplicates('trial').sort_values('trial').reset_index(drop=True)
+
+    def completeness(self, periodbins=10, depthbins=10, aliases=False):
+        """
+        Fraction of recovered injections on a period-depth grid.
+        :param periodbins: number of log spaced period bins or the bin edges
+        :param depthbins: number of log spaced depth bins or the bin edges
+        :param aliases: also count detections at an alias of the injected period
+        :return: completeness, number of trials, period edges, depth edges
+        """
+        res = self.results()
+        if numpy.ndim(periodbins) == 0:
+            periodbins = numpy.geomspace(self._periodrange[0], self._periodrange[1], periodbins + 1)
+        if numpy.ndim(depthbins) == 0:
+            depthbins = numpy.geomspace(self._depthrange[0], self._depthrange[1], depthbins + 1)
+        ntotal, pedges, dedges = numpy.histogram2d(res['period'], res['depth'], bins=[periodbins, depthbins])
+        found = res['recovered'].astype(bool)
+        if aliases:
+            found |= res['alias'].notna()
+        nfound = numpy.histogram2d(res['period'], res['depth'], bins=[pedges, dedges],
+                                   weights=found.astype(float))[0]
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            complete = nfound / ntotal
+        return complete, ntotal, pedges, dedges
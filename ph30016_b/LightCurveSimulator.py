@@ -6,14 +6,16 @@ import numpy
 import copy
 import pylab
 from MyExceptions import Hell, TheDead, Hope, InputError, StupidError, Cthulhu
+from RandomStreams import get_rng, randint
 
 
 class LightCurve:
-    def __init__(self, t=None, flux=None, fileload=False, alwaysupdate=True, timemidpoint=0, unit='Days'):
+    def __init__(self, t=None, flux=None, fileload=False, alwaysupdate=True, timemidpoint=0, unit='Days', rng=None):
         """
         Needs to add 1D check
         :param t:
         :param flux:
+        :param rng: random generator or seed used for all random draws, default is the global numpy.random state
         """
         if fileload:
             dat = numpy.loadtxt(fileload)
@@ -31,6 +33,7 @@ class LightCurve:
             self._t -= numpy.mean(self._t)
         self._tunit = unit
         self._error = numpy.zeros_like(self._rawflux)
+        self._rng = get_rng(rng)
 
     def add_noise(self, sn, update=None):
         """
@@ -40,7 +43,7 @@ class LightCurve:
         """
         if update is None:
             update = self._alwaysupdate
-        newflux = self._flux + self._flux * (self._rawflux / sn) * numpy.random.standard_normal(self._n)
+        newflux = self._flux + self._flux * (self._rawflux / sn) * self._rng.standard_normal(self._n)
         if update is True:
             self._flux = newflux
             self._error = self._flux * (self._rawflux / sn)
@@ -55,8 +58,8 @@ class LightCurve:
         :return:
         """
         n_outlier = int(fracoutlier*self._n)
-        locateoutliers = numpy.random.randint(0, self._n, n_outlier)
-        outliernoise = numpy.random.standard_normal(n_outlier) * stdoutlier * numpy.mean(self._rawflux)
+        locateoutliers = randint(self._rng, 0, self._n, n_outlier)
+        outliernoise = self._rng.standard_normal(n_outlier) * stdoutlier * numpy.mean(self._rawflux)
         self._flux[locateoutliers] += outliernoise
         return self._flux
 
@@ -81,7 +84,7 @@ class LightCurve:
         """
         if keepfrac <=0 or keepfrac > 1:
             raise InputError('keepfrac must be between 0 and 1.')
-        mask = numpy.random.choice(self._n, int(self._n * keepfrac), replace=False)
+        mask = self._rng.choice(self._n, int(self._n * keepfrac), replace=False)
         randt = self._t[mask]
         randflux = self._flux[mask]
         randerr = self._error[mask]
@@ -98,16 +101,16 @@ class LightCurve:
         """
         if self._tunit != 'Days':
             raise InputError('unit needs to be in days')
-        firstsundown = numpy.random.uniform(min(self._t), min(self._t) + 1, 1) # this randomly sets the time of sundown
+        firstsundown = self._rng.uniform(min(self._t), min(self._t) + 1, 1) # this randomly sets the time of sundown
         n_obsnights = int((max(self._t) - min(self._t)) - (firstsundown-min(self._t))) #number of nights in the lightcurve
         obs_t = [] #creating an empty list for output
         obs_flux = []
         obs_error = []
         for i in range(n_obsnights):
             sundown = ((i+1) * (firstsundown-min(self._t))) + firstsundown
-            obstime = numpy.random.uniform(sundown, sundown+nightfrac, obspernight)
+            obstime = self._rng.uniform(sundown, sundown+nightfrac, obspernight)
             for obs in obstime:
-                checkweather = numpy.random.uniform()
+                checkweather = self._rng.uniform()
                 if checkweather > missedfrac:
                     currmask = (self._t > obs) & (self._t < obs + obslength)
                     for t, f, e in zip(self._t[currmask], self._flux[currmask], self._error[currmask]):
@@ -125,7 +128,7 @@ class LightCurve:
         """
         baseline = numpy.zeros_like(self._t) + level
         if sn:
-            baseline += numpy.random.standard_normal(self._n)*level/sn
+            baseline += self._rng.standard_normal(self._n)*level/sn
         self._flux += baseline
         return self._flux
 
@@ -139,7 +142,7 @@ class LightCurve:
         f_trend = numpy.poly1d(polyparam)
         trend = f_trend(self._t)
         if sn:
-            trend += trend / sn * numpy.random.standard_normal(self._n)
+            trend += trend / sn * self._rng.standard_normal(self._n)
         self._flux += trend
 
     def running_average(self, n):
@@ -195,11 +198,11 @@ class LightCurve:
         return(self._t - shift, self._flux, self._error)
 
 class ShortTransit(LightCurve):
-    def __init__(self, fileload='Transit.txt'):
-        LightCurve.__init__(self, fileload=fileload)
+    def __init__(self, fileload='Transit.txt', rng=None):
+        LightCurve.__init__(self, fileload=fileload, rng=rng)
 
 
 class LongLightcurve(LightCurve):
-    def __init__(self, fileload='Transit_Long.txt'):
-        LightCurve.__init__(self, fileload=fileload)
+    def __init__(self, fileload='Transit_Long.txt', rng=None):
+        LightCurve.__init__(self, fileload=fileload, rng=rng)
 
@@ -0,0 +1,45 @@
+"""
+Supporting code for PH30116 - Data analysis and research methods in observational astrophysics - University of Bath
+RandomStreams hands out the random generators the simulators draw from
+"""
+import zlib
+
+import numpy
+
+
+def get_rng(rng=None):
+    """
+    Random generator for a simulator.
+    :param rng: None for the global numpy.random state, a seed, or a numpy Generator or RandomState
+    :return: Generator, RandomState or the numpy.random module
+    """
+    if rng is None:
+        return numpy.random
+    if isinstance(rng, (numpy.random.Generator, numpy.random.RandomState)):
+        return rng
+    return numpy.random.default_rng(rng)
+
+
+def stream(seed, i, key):
+    """
+    Independent random stream number i of a seed, for the set of draws called key. The stream only
+    depends on seed, key and i, so it is the same whichever process or order it is created in, and
+    sets with different keys never share streams.
+    :param seed: master seed
+    :param i: stream number
+    :param key: name of the set, e.g. 'images' or 'injection'
+    :return: Generator
+    """
+    key = zlib.crc32(str(key).encode())
+    return numpy.random.default_rng(numpy.random.SeedSequence(seed, spawn_key=(key, int(i))))
+
+
+def randint(rng, low, high=None, size=None):
+    """
+    Random integers from either kind of generator, Generator calls it integers.
+    A single draw comes back as a python int, as numpy.random.randint does.
+    """
+    if isinstance(rng, numpy.random.Generator):
+        draw = rng.integers(low, high, size)
+        return int(draw) if size is None else draw
+    return rng.randint(low, high, size)
@@ -0,0 +1,181 @@
+"""
+Supporting code for PH30116 - Data analysis and research methods in observational astrophysics - University of Bath
+SimulationFarm generates large sets of practice images and lightcurves in parallel
+"""
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import pandas as pd
+from numpy.lib.format import open_memmap
+from ImageSimulator import SimuIma
+from LightCurveSimulator import LightCurve
+from MyExceptions import InputError, StupidError
+from RandomStreams import stream
+
+
+def _practice_image(i, seed, name, size, kwargs):
+    """
+    Practice image number i, drawn from its own random stream.
+    :return: dict of output arrays, truth row, list of psf rows
+    """
+    sim = SimuIma(size=size, rng=stream(seed, i, name))
+    sim.practiceima(show=False, **kwargs)
+    truth = sim.get_practicedict()
+    row = {'image': i, 'npsfs': truth['npsfs'], 'sigma': truth['sigma'], 'bg': truth['bg'],
+           'ron': truth.get('ron', numpy.nan), 'shot': truth['shotflag']}
+    psfs = [{'image': i, 'x': x, 'y': y, 'flux': f}
+            for x, y, f in zip(truth['psf_x'], truth['psf_y'], truth['psf_flux'])]
+    return {'image': sim.get_data()}, row, psfs
+
+
+def _light_curve(i, seed, name, t, flux, snrange, fracoutlierrange, stdoutlier):
+    """
+    Noisy lightcurve number i, drawn from its own random stream.
+    :return: dict of output arrays, truth row, empty list
+    """
+    rng = stream(seed, i, name)
+    sn = rng.uniform(snrange[0], snrange[1])
+    fracoutlier = rng.uniform(fracoutlierrange[0], fracoutlierrange[1])
+    lc = LightCurve(t=t, flux=flux, alwaysupdate=True, rng=rng)
+    lc.add_noise(sn)
+    lc.add_outliers(fracoutlier, stdoutlier)
+    _, f, e = lc.getdata(shiftmidzero=False)
+    row = {'lightcurve': i, 'sn': sn, 'fracoutlier': fracoutlier, 'stdoutlier': stdoutlier}
+    return {'flux': f, 'error': e}, row, []
+
+
+def _run_shard(maker, shardfiles, start, stop, args):
+    """
+    Fills one shard inside a worker, writing straight into its memory mapped arrays.
+    :param maker: function making a single item
+    :param shardfiles: dict of output array name to shard file
+    :param start, stop: item numbers of the shard
+    :param args: extra arguments of maker
+    :return: truth rows, extra rows
+    """
+    out = {name: open_memmap(path, mode='r+') for name, path in shardfiles.items()}
+    rows, extra = [], []
+    for i in range(start, stop):
+        arrays, row, more = maker(i, *args)
+        for name, arr in arrays.items():
+            out[name][i - start] = arr
+        rows.append(row)
+        extra += more
+    for arr in out.values():
+        arr.flush()
+    return rows, extra
+
+
+class SimulationFarm:
+    """
+    Generates simulations over a process pool. Item i of a set always uses random stream i of the
+    seed and the set name, so the output is bit-identical whatever the number of workers and
+    sets with different names draw independent numbers. Outputs go into sharded
+    .npy files in outdir/<name>, with the ground truth parameters in outdir/<name>/truth.csv
+    """
+    def __init__(self, outdir, seed=0, nworkers=None, shardsize=256):
+        """
+        :param outdir: output directory
+        :param seed: master seed of the farm
+        :param nworkers: number of worker processes, default is one per cpu
+        :param shardsize: number of items per shard file
+        """
+        if type(shardsize) is not int or shardsize <= 0:
+            raise InputError('shardsize needs to be a positive integer')
+        self._outdir = outdir
+        self._seed = seed
+        self._nworkers = nworkers
+        self._shardsize = shardsize
+
+    def _run(self, name, n, maker, args, arrays, extraname=None):
+        """
+        Allocates the shards, farms them out and writes the truth tables.
+        :param name: name of the set
+        :param n: number of items
+        :param maker: function making a single item
+        :param args: extra arguments of maker
+        :param arrays: dict of output array name to (shape of one item, dtype)
+        :param extraname: name of the table for the extra rows
+        :return: truth table
+        """
+        if type(n) is not int or n <= 0:
+            raise InputError('n needs to be a positive integer')
+        setdir = os.path.join(self._outdir, name)
+        if not os.path.isdir(setdir):
+            os.makedirs(setdir)
+        for old in glob.glob(os.path.join(setdir, '*.npy')):
+            os.remove(old)
+        tasks = []
+        for shard, start in enumerate(range(0, n, self._shardsize)):
+            stop = min(start + self._shardsize, n)
+            shardfiles = {}
+            for arrname, (shape, dtype) in arrays.items():
+                shardfiles[arrname] = os.path.join(setdir, '%s_%04i.npy' % (arrname, shard))
+                open_memmap(shardfiles[arrname], mode='w+', dtype=dtype, shape=(stop - start,) + tuple(shape))
+            tasks.append((shardfiles, start, stop))
+        rows, extra = [], []
+        with ProcessPoolExecutor(max_workers=self._nworkers) as pool:
+            futures = [pool.submit(_run_shard, maker, shardfiles, start, stop, args)
+                       for shardfiles, start, stop in tasks]
+            for future in futures:
+                r, e = future.result()
+                rows += r
+                extra += e
+        truth = pd.DataFrame(rows)
+        truth.to_csv(os.path.join(setdir, 'truth.csv'), index=False)
+        if extraname is not None:
+            pd.DataFrame(extra).to_csv(os.path.join(setdir, '%s.csv' % extraname), index=False)
+        return truth
+
+    def practice_images(self, n, size=(50, 50), name='images', **kwargs):
+        """
+        Generates practice images, see SimuIma.practiceima for the keyword arguments.
+        Writes image_*.npy shards, truth.csv with one row per image and psfs.csv with one row per psf.
+        :param n: number of images
+        :param size: size of each image
+        :param name: name of the set
+        :return: truth table
+        """
+        return self._run(name, n, _practice_image, (self._seed, name, size, kwargs),
+                         {'image': (size, float)}, extraname='psfs')
+
+    def light_curves(self, n, t, flux, snrange=(50, 500), fracoutlierrange=(0, 0.01), stdoutlier=5,
+                     name='lightcurves'):
+        """
+        Generates noisy copies of a lightcurve with random signal to noise and outliers.
+        Writes flux_*.npy and error_*.npy shards and truth.csv with one row per lightcurve.
+        :param n: number of lightcurves
+        :param t: time array
+        :param flux: noise free flux
+        :param snrange: range of the signal to noise
+        :param fracoutlierrange: range of the fraction of outliers
+        :param stdoutlier: standard deviation of the outliers, relative to the mean flux
+        :param name: name of the set
+        :return: truth table
+        """
+        if numpy.shape(t) != numpy.shape(flux):
+            raise InputError("Shape of time and flux must match, but is %s and %s" % (numpy.shape(t), numpy.shape(flux)))
+        t = numpy.asarray(t, dtype=float)
+        flux = numpy.asarray(flux, dtype=float)
+        return self._run(name, n, _light_curve, (self._seed, name, t, flux, snrange, fracoutlierrange, stdoutlier),
+                         {'flux': (t.shape, float), 'error': (t.shape, float)})
+
+    def load(self, name, array):
+        """
+        Opens the shards of a set read-only.
+        :param name: name of the set
+        :param array: output array, i.e. image, flux or error
+        :return: list of memory mapped shards in item order
+        """
+        files = sorted(glob.glob(os.path.join(self._outdir, name, '%s_*.npy' % array)))
+        if not files:
+            raise StupidError("Oi! there is no %s in %s." % (array, os.path.join(self._outdir, name)))
+        return [numpy.load(f, mmap_mode='r') for f in files]
+
+    def truth(self, name, table='truth'):
+        """
+        Ground truth table of a set, truth or psfs
+        """
+        return pd.read_csv(os.path.join(self._outdir, name, '%s.csv' % table))
@@ -0,0 +1,262 @@
+"""
+Supporting code for PH30116 - Data analysis and research methods in observational astrophysics - University of Bath
+TransitFitting folds, bins and fits transits with numpy alone, for the fast likelihoods in utils
+"""
+import numpy
+import pandas as pd
+from MyExceptions import InputError
+
+
+def phase_bin(time, flux, error, period, t0, duration, window=0.25, inwidth=0.005, outwidth=0.02, texp=0.0204,
+              minpoints=5, nsub=5):
+    """
+    Folds the lightcurve on a transit ephemeris and bins it for the phase-binned likelihood.
+    Bins are narrow across the transit, where the shape changes, and wide outside it; sparse bins are merged.
+    time: input time in days
+    flux: input flux
+    error: input error
+    period, t0: ephemeris to fold on, kept fixed in the binned fit
+    duration: approximate transit duration, sets where the narrow bins go
+    window: half width of the window around each transit, same as the unbinned fit
+    inwidth, outwidth: bin width in and out of transit
+    texp: exposure time, widens the narrow region by one exposure on each side
+    minpoints: minimum number of points per bin
+    nsub: number of equal width sub-bins each bin is split into for the model average
+    returns: dict with bin phase, flux, error (propagated, inverse variance weighted), npoints,
+    jitterweight (sum(w**2) / sum(w)**2, scales a jitter variance to the bin), subphase and subweight
+    (nbins, nsub), edges, period and t0
+    """
+    time, flux, error = numpy.asarray(time), numpy.asarray(flux), numpy.asarray(error)
+    x_fold = (time - t0 + 0.5 * period) % period - 0.5 * period
+    mask = numpy.abs(x_fold) < window
+    if not mask.any():
+        raise InputError('No points within %s days of the transit' % window)
+    x, y, w = x_fold[mask], flux[mask], 1 / error[mask]**2
+
+    #narrow bins over ingress, transit and egress, wide bins outside
+    half = min(0.5 * duration + texp, window)
+    inner = numpy.linspace(-half, half, int(numpy.ceil(2 * half / inwidth)) + 1)
+    outer = numpy.linspace(half, window, int(numpy.ceil((window - half) / outwidth)) + 1)[1:]
+    edges = numpy.concatenate((-outer[::-1], inner, outer))
+
+    #merge sparse bins into their right neighbour, the last one into its left
+    counts = numpy.histogram(x, bins=edges)[0]
+    keep, n = [edges[0]], 0
+    for edge, count in zip(edges[1:], counts):
+        n += count
+        if n >= minpoints:
+            keep.append(edge)
+            n = 0
+    if keep[-1] != edges[-1]:
+        if n > 0 and len(keep) > 1:
+            keep[-1] = edges[-1]
+        else:
+            keep.append(edges[-1])
+    edges = numpy.array(keep)
+
+    idx = numpy.clip(numpy.digitize(x, edges) - 1, 0, len(edges) - 2)
+    npoints = numpy.bincount(idx, minlength=len(edges) - 1)
+    sumw = numpy.bincount(idx, weights=w, minlength=len(edges) - 1)
+    good = npoints > 0
+    bflux = numpy.bincount(idx, weights=w * y, minlength=len(edges) - 1)[good] / sumw[good]
+    bphase = numpy.bincount(idx, weights=w * x, minlength=len(edges) - 1)[good] / sumw[good]
+    berror = 1 / numpy.sqrt(sumw[good])
+    #variance of the weighted mean per unit of white jitter variance added to every point
+    jitterweight = numpy.bincount(idx, weights=w**2, minlength=len(edges) - 1)[good] / sumw[good]**2
+
+    #each bin is split into sub-bins, kept as their weighted mean phase and share of the bin weight,
+    #so the weighted model average over them follows the weighted mean of the binned data
+    width = edges[idx + 1] - edges[idx]
+    sub = idx * nsub + numpy.clip(((x - edges[idx]) / width * nsub).astype(int), 0, nsub - 1)
+    subw = numpy.bincount(sub, weights=w, minlength=nsub * (len(edges) - 1)).reshape(-1, nsub)[good]
+    subx = numpy.bincount(sub, weights=w * x, minlength=nsub * (len(edges) - 1)).reshape(-1, nsub)[good]
+    subphase = numpy.where(subw > 0, subx / numpy.where(subw > 0, subw, 1), bphase[:, None])
+    subweight = subw / subw.sum(axis=1, keepdims=True)
+
+    return {'phase': bphase, 'flux': bflux, 'error': berror, 'npoints': npoints[good],
+            'jitterweight': jitterweight, 'subphase': subphase, 'subweight': subweight, 'edges': edges,
+            'period': period, 't0': t0}
+
+
+def split_transits(time, flux, error, period, t0, window=0.25):
+    """
+    Splits the lightcurve into one window per transit, padded to the same length.
+    time: input time in days
+    flux: input flux
+    error: input error
+    period, t0: ephemeris used to predict the transits
+    window: half width of each window
+    returns: epoch numbers, padded time, flux and error (nepochs, npad), mask of the real points
+    """
+    time = numpy.asarray(time, dtype=float)
+    flux, error = numpy.asarray(flux, dtype=float), numpy.asarray(error, dtype=float)
+    n = numpy.round((time - t0) / period).astype(int)
+    inwindow = numpy.abs(time - t0 - n * period) < window
+    order = numpy.argsort(n[inwindow], kind='stable')
+    n, time, flux, error = n[inwindow][order], time[inwindow][order], flux[inwindow][order], error[inwindow][order]
+    epochs, start, counts = numpy.unique(n, return_index=True, return_counts=True)
+    row = numpy.repeat(numpy.arange(len(epochs)), counts)
+    col = numpy.arange(len(n)) - numpy.repeat(start, counts)
+
+    shape = (len(epochs), counts.max() if len(counts) else 0)
+    t_pad, f_pad, e_pad = numpy.zeros(shape), numpy.ones(shape), numpy.ones(shape)
+    mask = numpy.zeros(shape, dtype=bool)
+    t_pad[row, col], f_pad[row, col], e_pad[row, col], mask[row, col] = time, flux, error, True
+    return epochs, t_pad, f_pad, e_pad, mask
+
+
+def _transit_jacobian(x, tc, depth, duration):
+    """
+    The quartic transit of utils.model_curve, flat at 1 outside the transit, and its derivatives
+    with respect to tc, depth and duration. All arguments broadcast against each other.
+    """
+    s = (x - tc) / duration
+    intransit = numpy.abs(s) < 0.5
+    q = 16 * s**4
+    m = numpy.where(intransit, 1 - depth * (1 - q), 1.)
+    dtc = numpy.where(intransit, -64 * depth * s**3 / duration, 0.)
+    ddepth = numpy.where(intransit, q - 1, 0.)
+    dduration = numpy.where(intransit, -64 * depth * s**4 / duration, 0.)
+    return m, numpy.stack((dtc, ddepth, dduration), axis=-1)
+
+
+def fit_transit_times(time, flux, error, period, t0, duration, depth, window=0.25, shared=('depth', 'duration'),
+                      minpoints=3, maxiter=200, tol=1e-8, absolute_sigma=False):
+    """
+    Fits the mid-time of every transit at once, for transit timing variations.
+    The lightcurve is split into padded windows around each predicted transit and all epochs are fitted
+    with one vectorized Levenberg-Marquardt solver on the quartic transit of utils.model_curve.
+    Shared shape parameters are fitted jointly to all epochs, through the Schur complement of the
+    normal equations, so the cost still only grows linearly with the number of epochs.
+    Each tc is kept within the window of its transit and the duration below twice the window; epochs that
+    end on those bounds or run out of iterations are flagged as not converged and left out of the ephemeris.
+    time: input time in days
+    flux: input flux, normalised to 1 out of transit
+    error: input error
+    period, t0: ephemeris used to predict the transits
+    duration, depth: starting guesses of the transit shape
+    window: half width of the window around each transit
+    shared: shape parameters fitted jointly to all epochs, any of 'depth' and 'duration'. Sharing both is
+    the usual choice for timing variations and is much more robust at low signal to noise
+    minpoints: minimum number of in transit points for an epoch to be fitted
+    maxiter: maximum number of iterations
+    tol: relative change in chi squared at which the fit has converged, changes below 1e-3 always count
+    absolute_sigma: use the errors as they are, otherwise the covariance is scaled by the reduced chi squared
+    returns: table of epoch, tc, tc_err, depth, depth_err, duration, duration_err, npoints, converged, o_c;
+    dict of the linear ephemeris (period, period_err, t0, t0_err) the O-C is measured against
+    """
+    names = ['tc', 'depth', 'duration']
+    if not set(shared) <= {'depth', 'duration'}:
+        raise InputError("shared can only hold 'depth' and 'duration'")
+    li = [i for i, name in enumerate(names) if name not in shared]
+    gi = [i for i, name in enumerate(names) if name in shared]
+
+    epochs, t, f, e, mask = split_transits(time, flux, error, period, t0, window)
+    predicted = t0 + epochs * period
+    enough = numpy.sum(mask & (numpy.abs(t - predicted[:, None]) < 0.5 * duration), axis=1) >= minpoints
+    if not enough.any():
+        raise InputError('No transit has %i points in transit' % minpoints)
+    epochs, t, f, e, mask, predicted = epochs[enough], t[enough], f[enough], e[enough], mask[enough], predicted[enough]
+    w = mask / e**2
+    nepoch = len(epochs)
+
+    p = numpy.empty((nepoch, 3))
+    p[:, 0], p[:, 1], p[:, 2] = predicted, depth, duration
+
+    def chi2(p, idx):
+        m = _transit_jacobian(t[idx], p[idx, 0:1], p[idx, 1:2], p[idx, 2:3])[0]
+        return numpy.sum(w[idx] * (f[idx] - m)**2, axis=1)
+
+    def normal_equations(p, idx):
+        m, J = _transit_jacobian(t[idx], p[idx, 0:1], p[idx, 1:2], p[idx, 2:3])
+        JwT = numpy.swapaxes(J * w[idx, :, None], 1, 2)
+        H = JwT @ J
+        g = (JwT @ (f[idx] - m)[..., None])[..., 0]
+        return (H[:, li][:, :, li], H[:, li][:, :, gi], H[:, gi][:, :, gi].sum(axis=0),
+                g[:, li], g[:, gi].sum(axis=0))
+
+    def solve(A, B, C, bl, bg):
+        #local blocks are independent per epoch, shared parameters go through the Schur complement
+        Ainv_bl = numpy.linalg.solve(A, bl[..., None])[..., 0]
+        if not gi:
+            return Ainv_bl, numpy.zeros(0)
+        Ainv_B = numpy.linalg.solve(A, B)
+        S = C - numpy.einsum('eki,ekj->ij', B, Ainv_B)
+        dg = numpy.linalg.solve(S, bg - numpy.einsum('eki,ek->i', B, Ainv_bl))
+        return Ainv_bl - Ainv_B @ dg, dg
+
+    #one damping factor per epoch, unless the epochs are tied together by shared parameters.
+    #Independent epochs drop out of the batch once they have converged.
+    lam = numpy.full(nepoch, 1e-3)
+    current = chi2(p, slice(None))
+    active = numpy.ones(nepoch, dtype=bool)
+    converged = numpy.zeros(nepoch, dtype=bool)
+    for _ in range(maxiter):
+        idx = numpy.flatnonzero(active)
+        A, B, C, bl, bg = normal_equations(p, idx)
+        dA = numpy.diagonal(A, axis1=1, axis2=2)
+        dC = numpy.diag(C)
+        A_damped = A + (lam[idx, None] * numpy.where(dA > 0, dA, 1.))[..., None] * numpy.eye(len(li))
+        C_damped = C + lam[0] * numpy.diag(numpy.where(dC > 0, dC, 1.))
+        dl, dg = solve(A_damped, B, C_damped, bl, bg)
+        trial = p[idx]
+        trial[:, li] += dl
+        trial[:, gi] += dg
+        trial[:, 0] = numpy.clip(trial[:, 0], predicted[idx] - window, predicted[idx] + window)
+        trial[:, 1] = numpy.clip(numpy.abs(trial[:, 1]), 0., 1.)
+        trial[:, 2] = numpy.clip(numpy.abs(trial[:, 2]), 1e-6 * window, 2 * window)
+        p_trial = p.copy()
+        p_trial[idx] = trial
+        new = chi2(p_trial, idx)
+        old = current[idx]
+        if gi:
+            better = numpy.full(len(idx), new.sum() < old.sum())
+            done = better[0] and old.sum() - new.sum() <= max(tol * new.sum(), 1e-3)
+        else:
+            better = new < old
+        p[idx[better]] = trial[better]
+        current[idx[better]] = new[better]
+        lam[idx] = numpy.where(better, lam[idx] / 10, lam[idx] * 10)
+        if gi:
+            if done or lam[0] > 1e10:
+                converged[:] = True
+                break
+        else:
+            stop = idx[numpy.where(better, old - new <= numpy.maximum(tol * new, 1e-3), lam[idx] > 1e10)]
+            active[stop] = False
+            converged[stop] = True
+            if not active.any():
+                break
+    atbound = (numpy.abs(p[:, 0] - predicted) >= window * (1 - 1e-9)) | (p[:, 2] >= 2 * window * (1 - 1e-9))
+    converged &= ~atbound
+
+    #covariance from the undamped normal equations at the solution
+    A, B, C, bl, bg = normal_equations(p, slice(None))
+    Ainv = numpy.linalg.pinv(A)
+    cov_l = Ainv
+    var_g = numpy.zeros(0)
+    if gi:
+        Ainv_B = Ainv @ B
+        Sinv = numpy.linalg.pinv(C - numpy.einsum('eki,ekj->ij', B, Ainv_B))
+        cov_l = Ainv + Ainv_B @ Sinv @ numpy.swapaxes(Ainv_B, 1, 2)
+        var_g = numpy.diag(Sinv)
+    npoints = mask.sum(axis=1)
+    if not absolute_sigma:
+        scale = current.sum() / (npoints.sum() - nepoch * len(li) - len(gi))
+        cov_l, var_g = cov_l * scale, var_g * scale
+    perr = numpy.empty((nepoch, 3))
+    perr[:, li] = numpy.sqrt(numpy.diagonal(cov_l, axis1=1, axis2=2))
+    perr[:, gi] = numpy.sqrt(var_g)
+
+    #O-C against a weighted linear ephemeris through the converged mid-times, its covariance is scaled
+    #by the scatter about the line, since the tc errors come out too small at low signal to noise
+    if converged.sum() > 3:
+        coef, cov = numpy.polyfit(epochs[converged], p[converged, 0], 1, w=1 / perr[converged, 0], cov=True)
+    else:
+        coef, cov = numpy.array([period, t0]), numpy.full((2, 2), numpy.nan)
+    ephemeris = {'period': coef[0], 'period_err': numpy.sqrt(cov[0, 0]), 't0': coef[1], 't0_err': numpy.sqrt(cov[1, 1])}
+
+    table = pd.DataFrame({'epoch': epochs, 'tc': p[:, 0], 'tc_err': perr[:, 0], 'depth': p[:, 1],
+                          'depth_err': perr[:, 1], 'duration': p[:, 2], 'duration_err': perr[:, 2],
+                          'npoints': npoints, 'converged': converged, 'o_c': p[:, 0] - numpy.polyval(coef, epochs)})
+    return table, ephemeris
@@ -0,0 +1,8 @@
+"""
+The modules import each other by name, as they do from the notebooks, so the tests run with ph30016_b on the path.
+"""
+import os
+import sys
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
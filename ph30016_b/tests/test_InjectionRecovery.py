@@ -0,0 +1,68 @@
+import numpy
+import pytest
+
+from InjectionRecovery import InjectionCampaign, mask_transits, box_transits
+from MyExceptions import StupidError
+
+
+def make_lightcurve(seed=1):
+    rng = numpy.random.default_rng(seed)
+    time = numpy.concatenate((numpy.arange(0, 40, 0.02), numpy.arange(45, 90, 0.02)))
+    error = numpy.full(time.size, 2e-4)
+    flux = 1 + rng.normal(0, 2e-4, time.size)
+    segments = [(0, 2000), (2000, time.size)]
+    return time, flux, error, segments
+
+
+def test_mask_transits():
+    time = numpy.arange(0, 20, 0.01)
+    keep = mask_transits(time, [(5., 1., 0.2)])
+    phase = (time - 1 + 2.5) % 5 - 2.5
+    assert numpy.all(keep == (numpy.abs(phase) >= 0.1))
+    assert numpy.all(mask_transits(time, []))
+
+
+def test_known_planet_is_masked(tmp_path):
+    time, flux, error, segments = make_lightcurve()
+    flux *= box_transits(time, [7.3], [2.], [0.01], [0.2])[0]
+    campaign = InjectionCampaign(time, flux, error, str(tmp_path), segments=segments, periodrange=(2., 10.),
+                                 depthrange=(3e-3, 5e-3), durationrange=(0.15, 0.2),
+                                 periods=numpy.geomspace(2, 10, 3000), durations=(0.1, 0.2),
+                                 ephemerides=[(7.3, 2., 0.3)])
+    res = campaign.run(4, nworkers=2, batchsize=2)
+    assert len(res) == 4
+    assert not numpy.any(numpy.abs(res['found_period'] - 7.3) < 0.05)
+    assert res['recovered'].all()
+    base = numpy.load(str(tmp_path / 'time.npy'))
+    assert base.size == mask_transits(time, [(7.3, 2., 0.3)]).sum()
+    assert numpy.load(str(tmp_path / 'segments.npy'))[-1, 1] == base.size
+
+
+def test_resume_and_changed_setup(tmp_path):
+    time, flux, error, segments = make_lightcurve()
+    kwargs = dict(segments=segments, periodrange=(2., 10.), depthrange=(3e-3, 5e-3), durationrange=(0.15, 0.2),
+                  periods=numpy.geomspace(2, 10, 1000), durations=(0.1, 0.2))
+    campaign = InjectionCampaign(time, flux, error, str(tmp_path), **kwargs)
+    campaign.run(2, nworkers=1)
+    res = campaign.run(3, nworkers=1)
+    assert list(res['trial']) == [0, 1, 2]
+    complete, ntotal, _, _ = campaign.completeness(2, 2)
+    assert ntotal.sum() == 3
+    with pytest.raises(StupidError):
+        InjectionCampaign(time, flux, error, str(tmp_path), num_sigma=5, **kwargs).run(4, nworkers=1)
+    with pytest.raises(StupidError):
+        InjectionCampaign(time, flux * 1.001, error, str(tmp_path), **kwargs).run(4, nworkers=1)
+    with pytest.raises(StupidError):
+        InjectionCampaign(time, flux, error, str(tmp_path), min_snr=20, **kwargs).run(4, nworkers=1)
+
+
+def test_detection_threshold(tmp_path):
+    time, flux, error, segments = make_lightcurve()
+    kwargs = dict(segments=segments, periodrange=(2., 10.), depthrange=(1e-5, 5e-3), durationrange=(0.15, 0.2),
+                  periods=numpy.geomspace(2, 10, 1000), durations=(0.1, 0.2))
+    res = InjectionCampaign(time, flux, error, str(tmp_path / 'seven'), **kwargs).run(12, nworkers=2, batchsize=4)
+    found = res['recovered'] | res['alias'].notna()
+    assert found.any()
+    assert numpy.all(res['found_snr'][found] >= 7)
+    res = InjectionCampaign(time, flux, error, str(tmp_path / 'strict'), min_snr=1e6, **kwargs).run(12, nworkers=2)
+    assert not res['recovered'].any() and res['alias'].isna().all()
@@ -0,0 +1,96 @@
+import numpy
+
+from ImageSimulator import SimuIma, crowded_field
+from LightCurveSimulator import LightCurve
+from RandomStreams import get_rng, randint, stream
+from SimulationFarm import SimulationFarm
+
+
+def test_get_rng():
+    assert get_rng() is numpy.random
+    gen = numpy.random.default_rng(1)
+    assert get_rng(gen) is gen
+    assert isinstance(get_rng(3), numpy.random.Generator)
+    assert type(randint(gen, 5, 10)) is int
+    assert type(randint(get_rng(), 5, 10)) is int
+
+
+def test_stream_is_independent_of_order():
+    first = [stream(7, i, 'images').uniform() for i in range(5)]
+    second = [stream(7, i, 'images').uniform() for i in reversed(range(5))][::-1]
+    assert first == second
+    assert len(set(first)) == 5
+    other = [stream(7, i, 'injection').uniform() for i in range(5)]
+    assert not set(first) & set(other)
+
+
+def test_lightcurve_rng():
+    t = numpy.linspace(0, 10, 200)
+    flux = numpy.ones_like(t)
+    curves = []
+    for rng in (1, 1, numpy.random.default_rng(1)):
+        lc = LightCurve(t=t, flux=flux, rng=rng)
+        lc.add_noise(100)
+        lc.add_outliers(0.05, 3)
+        curves.append(lc.getdata()[1])
+    assert numpy.array_equal(curves[0], curves[1])
+    assert numpy.array_equal(curves[0], curves[2])
+    #without an rng the global numpy.random state is used, as before
+    numpy.random.seed(4)
+    a = LightCurve(t=t, flux=flux).add_noise(100, update=False)
+    numpy.random.seed(4)
+    assert numpy.array_equal(a, flux + flux * (flux / 100) * numpy.random.standard_normal(t.size))
+
+
+def test_image_rng():
+    assert crowded_field(rng=2).npsf == crowded_field(rng=2).npsf
+    a, b = SimuIma(size=(30, 30), rng=5), SimuIma(size=(30, 30), rng=5)
+    for sim in (a, b):
+        sim.practiceima(npsf=2, show=False)
+    assert numpy.array_equal(a.get_data(), b.get_data())
+    assert a.get_practicedict() == b.get_practicedict()
+
+
+def test_practiceima_keeps_ron():
+    sim = SimuIma(size=(60, 60), rng=3)
+    sim.practiceima(npsf=1, bgrange=[5, 5], ronrange=[40, 40], show=False)
+    truth = sim.get_practicedict()
+    assert truth['ron'] == 40
+    #shot noise keeps the mean of the image, poisson RON adds its level on top
+    excess = numpy.mean(sim.get_data()) - truth['bg'] - truth['psf_flux'][0] / 60.**2
+    assert abs(excess - 40) < 1
+
+
+def test_farm_is_independent_of_workers(tmp_path):
+    t = numpy.linspace(0, 10, 300)
+    flux = 1 - 0.01 * (numpy.abs(t - 5) < 0.3)
+    outputs = []
+    for nworkers, shardsize in ((1, 7), (3, 2)):
+        farm = SimulationFarm(str(tmp_path / str(nworkers)), seed=11, nworkers=nworkers, shardsize=shardsize)
+        truth = farm.practice_images(9, size=(25, 25), edge=0.2)
+        farm.light_curves(9, t, flux)
+        outputs.append((numpy.concatenate(farm.load('images', 'image')),
+                        numpy.concatenate(farm.load('lightcurves', 'flux')),
+                        numpy.concatenate(farm.load('lightcurves', 'error')),
+                        truth, farm.truth('images', 'psfs'), farm.truth('lightcurves')))
+    for a, b in zip(*outputs):
+        if isinstance(a, numpy.ndarray):
+            assert numpy.array_equal(a, b)
+        else:
+            assert a.equals(b)
+    assert len(outputs[0][0]) == 9
+    assert list(outputs[0][3]['image']) == list(range(9))
+
+
+def test_farm_sets_are_independent(tmp_path):
+    t = numpy.linspace(0, 10, 100)
+    farm = SimulationFarm(str(tmp_path), seed=3, nworkers=2, shardsize=20)
+    images = farm.practice_images(60, size=(20, 20), edge=0.2)
+    curves = farm.light_curves(60, t, numpy.ones_like(t), snrange=(3, 6))
+    again = farm.light_curves(60, t, numpy.ones_like(t), snrange=(3, 6), name='again')
+    #same name draws the same numbers, a different one doesn't follow any other set
+    assert numpy.array_equal(curves['sn'], farm.light_curves(60, t, numpy.ones_like(t), snrange=(3, 6))['sn'])
+    for a, b in ((images['sigma'], curves['sn']), (curves['sn'], again['sn'])):
+        a, b = numpy.asarray(a), numpy.asarray(b)
+        assert not numpy.isclose(a[:, None], b[None, :]).any()
+        assert abs(numpy.corrcoef(a, b)[0, 1]) < 0.5
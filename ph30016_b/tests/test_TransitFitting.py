@@ -0,0 +1,162 @@
+import numpy
+import pytest
+
+from MyExceptions import InputError
+from TransitFitting import _transit_jacobian, fit_transit_times, phase_bin, split_transits
+
+PERIOD, T0, DURATION, TEXP = 4.8855, 134.2, 0.22, 0.0204
+
+
+def kepler_like(seed=1, sigma=2e-4):
+    """
+    17 quarters of long cadence sampling with gaps between them.
+    """
+    rng = numpy.random.default_rng(seed)
+    time = numpy.concatenate([numpy.arange(120 + 90 * q, 205 + 90 * q, TEXP) for q in range(17)])
+    error = numpy.full(time.size, sigma)
+    return rng, time, error
+
+
+def trapezoid(x, depth, duration=DURATION, ingress=0.02):
+    """
+    Exposure integrated trapezoid transit in plain numpy.
+    """
+    offsets = (numpy.arange(7) + 0.5) / 7 * TEXP - 0.5 * TEXP
+    s = numpy.abs(x[..., None] + offsets)
+    return (1 - depth * numpy.clip((0.5 * duration - s) / ingress + 0.5, 0, 1)).mean(axis=-1)
+
+
+def test_phase_bin_counts_and_errors():
+    rng, time, error = kepler_like()
+    error = error * rng.uniform(0.5, 2, time.size)
+    flux = 1 + rng.normal(0, error)
+    binned = phase_bin(time, flux, error, PERIOD, T0, DURATION, minpoints=7, nsub=4)
+
+    x_fold = (time - T0 + 0.5 * PERIOD) % PERIOD - 0.5 * PERIOD
+    inwindow = numpy.abs(x_fold) < 0.25
+    assert binned['npoints'].sum() == inwindow.sum()
+    assert numpy.all(binned['npoints'][:-1] >= 7)
+    assert binned['subphase'].shape == binned['subweight'].shape == (len(binned['flux']), 4)
+    assert numpy.allclose(binned['subweight'].sum(axis=1), 1)
+    assert numpy.allclose((binned['subphase'] * binned['subweight']).sum(axis=1), binned['phase'])
+
+    idx = numpy.clip(numpy.digitize(x_fold[inwindow], binned['edges']) - 1, 0, len(binned['edges']) - 2)
+    w = 1 / error[inwindow]**2
+    sumw = numpy.bincount(idx, weights=w, minlength=len(binned['edges']) - 1)
+    sumw = sumw[sumw > 0]
+    assert numpy.allclose(binned['error'], 1 / numpy.sqrt(sumw))
+    #a jitter sigma added to every point adds sigma**2 * jitterweight to the variance of the bin
+    wsq = numpy.bincount(idx, weights=w**2, minlength=len(binned['edges']) - 1)
+    assert numpy.allclose(binned['jitterweight'], wsq[wsq > 0] / sumw**2)
+    jitter = numpy.array([phase_bin(time, 1 + rng.normal(0, 3e-4, time.size), error, PERIOD, T0, DURATION,
+                                    minpoints=7, nsub=4)['flux'] for _ in range(400)])
+    ratio = jitter.var(axis=0) / (9e-8 * binned['jitterweight'])
+    assert abs(ratio.mean() - 1) < 0.05
+    assert not numpy.allclose(binned['jitterweight'], 1 / binned['npoints'], rtol=0.05)
+    assert numpy.allclose(binned['flux'], numpy.bincount(idx, weights=w * flux[inwindow])[sumw > 0] / sumw)
+    #the narrow bins sit across the transit
+    widths = numpy.diff(binned['edges'])
+    centres = binned['edges'][:-1] + 0.5 * widths
+    assert widths[numpy.abs(centres) < 0.5 * DURATION].max() < widths[numpy.abs(centres) > DURATION].min()
+
+
+def test_phase_bin_empty_window():
+    time = numpy.arange(0, 1, 0.01)
+    with pytest.raises(InputError):
+        phase_bin(time + 2, numpy.ones_like(time), numpy.ones_like(time), 10., 7., 0.2)
+
+
+def test_subphases_bound_the_binning_bias():
+    from scipy.optimize import minimize_scalar
+    rng, time, error = kepler_like()
+    x_fold = (time - T0 + 0.5 * PERIOD) % PERIOD - 0.5 * PERIOD
+    flux = trapezoid(x_fold, 0.0065) + rng.normal(0, error)
+    binned = phase_bin(time, flux, error, PERIOD, T0, DURATION)
+    m = numpy.abs(x_fold) < 0.25
+    assert len(binned['flux']) < m.sum() / 50
+
+    def fit(chi2):
+        return minimize_scalar(chi2, bounds=(0, 0.02), method='bounded', options={'xatol': 1e-9}).x
+    full = fit(lambda d: numpy.sum(((flux[m] - trapezoid(x_fold[m], d)) / error[m])**2))
+    fast = fit(lambda d: numpy.sum(((binned['flux'] - numpy.sum(trapezoid(binned['subphase'], d)
+                                                                * binned['subweight'], axis=1))
+                                    / binned['error'])**2))
+    centres = fit(lambda d: numpy.sum(((binned['flux'] - trapezoid(binned['phase'], d)) / binned['error'])**2))
+    sigma = 1 / numpy.sqrt(numpy.sum(((trapezoid(x_fold[m], 1.) - 1) / error[m])**2))
+    assert abs(fast - full) < 0.1 * sigma
+    #evaluating at the bin centres alone is measurably biased
+    assert abs(centres - full) > abs(fast - full)
+
+
+def ttv_lightcurve(seed, depth, sigma, amplitude=0.004):
+    """
+    Quartic transits with a sinusoidal timing variation, on Kepler-like sampling with random gaps.
+    """
+    rng, time, error = kepler_like(seed, sigma)
+    keep = rng.uniform(size=time.size) > 0.1
+    time, error = time[keep], error[keep]
+    epoch = numpy.round((time - T0) / PERIOD)
+    true = T0 + epoch * PERIOD + amplitude * numpy.sin(2 * numpy.pi * epoch / 37)
+    flux = _transit_jacobian(time, true, depth, DURATION)[0] + rng.normal(0, error)
+    return time, flux, error
+
+
+def test_split_transits_padding():
+    time = numpy.array([0.9, 1.0, 1.1, 2.5, 3.05, 4.8, 5.0, 5.1, 5.2])
+    flux = numpy.arange(time.size, dtype=float)
+    epochs, t, f, e, mask = split_transits(time, flux, numpy.full(time.size, 0.1), 2., 1., window=0.25)
+    assert list(epochs) == [0, 1, 2]
+    assert t.shape == (3, 4)
+    assert list(mask.sum(axis=1)) == [3, 1, 4]
+    assert numpy.array_equal(t[mask], [0.9, 1.0, 1.1, 3.05, 4.8, 5.0, 5.1, 5.2])
+    assert numpy.array_equal(f[mask], [0, 1, 2, 4, 5, 6, 7, 8])
+    #padding is neutral, flux at the out of transit level and zero weight through the mask
+    assert numpy.all(f[~mask] == 1) and numpy.all(e[~mask] == 1)
+
+
+def test_fit_transit_times_recovers_ttvs():
+    time, flux, error = ttv_lightcurve(3, 0.0065, 3e-4)
+    table, ephemeris = fit_transit_times(time, flux, error, PERIOD, T0, 0.2, 0.005)
+    assert table['converged'].all()
+    assert numpy.allclose(table['depth'], 0.0065, rtol=0.02)
+    assert numpy.allclose(table['duration'], DURATION, rtol=0.02)
+    true = T0 + table['epoch'] * PERIOD + 0.004 * numpy.sin(2 * numpy.pi * table['epoch'] / 37)
+    pull = (table['tc'] - true) / table['tc_err']
+    assert abs(pull.mean()) < 0.3 and 0.7 < pull.std() < 1.5
+    assert abs(ephemeris['t0'] - T0) < 4 * ephemeris['t0_err']
+    assert abs(ephemeris['period'] - PERIOD) < 4 * ephemeris['period_err']
+    #the O-C follows the injected variation
+    assert numpy.corrcoef(table['o_c'], numpy.sin(2 * numpy.pi * table['epoch'] / 37))[0, 1] > 0.85
+
+
+def test_shared_parameters_match_a_joint_fit():
+    from scipy.optimize import least_squares
+    time, flux, error = ttv_lightcurve(4, 0.0065, 5e-4)
+    keep = time < T0 + 5.5 * PERIOD
+    time, flux, error = time[keep], flux[keep], error[keep]
+    table, _ = fit_transit_times(time, flux, error, PERIOD, T0, 0.2, 0.005)
+    epochs = table['epoch'].values
+
+    def residuals(q):
+        epoch = numpy.round((time - T0) / PERIOD)
+        tc = q[2:][numpy.searchsorted(epochs, epoch)]
+        return (flux - _transit_jacobian(time, tc, q[0], q[1])[0]) / error
+    start = numpy.concatenate(([table['depth'][0], table['duration'][0]], table['tc']))
+    joint = least_squares(residuals, start, x_scale=[1e-4, 1e-3] + [1e-3] * len(epochs), xtol=1e-12).x
+    assert numpy.allclose(table['tc'], joint[2:], atol=0.05 * table['tc_err'].min())
+    assert abs(table['depth'][0] - joint[0]) < 0.05 * table['depth_err'][0]
+    independent, _ = fit_transit_times(time, flux, error, PERIOD, T0, 0.2, 0.005, shared=())
+    assert numpy.all(numpy.abs(independent['tc'] - table['tc']) < 3 * independent['tc_err'])
+
+
+def test_fit_transit_times_bounds_at_low_signal_to_noise():
+    time, flux, error = ttv_lightcurve(3, 0.002, 1e-3)
+    for shared in ((), ('depth', 'duration')):
+        table, ephemeris = fit_transit_times(time, flux, error, PERIOD, T0, 0.2, 0.0015, shared=shared)
+        predicted = T0 + table['epoch'] * PERIOD
+        assert numpy.all(numpy.abs(table['tc'] - predicted) <= 0.25)
+        assert numpy.all(table['duration'] <= 0.5)
+        assert table['converged'].dtype == bool
+        assert abs(ephemeris['t0'] - T0) < 4 * ephemeris['t0_err']
+    with pytest.raises(InputError):
+        fit_transit_times(time, flux, error, PERIOD, T0, 0.2, 0.0015, shared=('tc',))
@@ -0,0 +1,57 @@
+import numpy
+import pytest
+
+from TransitFitting import phase_bin
+
+PERIOD, T0, DURATION, TEXP = 4.8855, 134.2, 0.22, 0.0204
+
+
+def kepler_like(seed=1, sigma=2e-4):
+    """
+    17 quarters of long cadence sampling with gaps between them.
+    """
+    rng = numpy.random.default_rng(seed)
+    time = numpy.concatenate([numpy.arange(120 + 90 * q, 205 + 90 * q, TEXP) for q in range(17)])
+    error = numpy.full(time.size, sigma)
+    return rng, time, error
+
+
+def test_binned_light_curve_bounds_the_bias():
+    try:
+        import utils
+        import exoplanet as xo
+        from aesara_theano_fallback import aesara as theano
+        import aesara_theano_fallback.tensor as tt
+    except ImportError:
+        pytest.skip('utils needs the pymc3 and exoplanet stack')
+    from scipy.optimize import minimize_scalar
+
+    rng, time, error = kepler_like(sigma=3e-4)
+    u = [0.4, 0.25]
+    orbit = xo.orbits.KeplerianOrbit(period=PERIOD, t0=T0, b=0.3, duration=DURATION, ror=0.08)
+    x_fold = (time - T0 + 0.5 * PERIOD) % PERIOD - 0.5 * PERIOD
+    m = numpy.abs(x_fold) < 0.25
+    t, e = time[m], error[m]
+
+    ror = tt.dscalar()
+    full_model = theano.function([ror], tt.sum(xo.LimbDarkLightCurve(u).get_light_curve(
+        orbit=orbit, r=ror, t=t, texp=TEXP, oversample=7), axis=-1))
+    flux = 1 + full_model(0.08) + rng.normal(0, e)
+    binned = phase_bin(t, flux, e, PERIOD, T0, DURATION)
+    binned_model = theano.function([ror], utils.binned_light_curve(u, orbit, ror, binned, texp=TEXP))
+
+    def fit(chi2):
+        return minimize_scalar(chi2, bounds=(0.05, 0.11), method='bounded', options={'xatol': 1e-9}).x
+    full = fit(lambda r: numpy.sum(((flux - 1 - full_model(r)) / e)**2))
+    fast = fit(lambda r: numpy.sum(((binned['flux'] - 1 - binned_model(r)) / binned['error'])**2))
+    #uncertainty of the radius ratio from the curvature of the full chi squared
+    h = 1e-4
+    dmodel = (full_model(full + h) - full_model(full - h)) / (2 * h)
+    sigma = 1 / numpy.sqrt(numpy.sum((dmodel / e)**2))
+    assert len(binned['flux']) < len(t) / 50
+    assert abs(fast - full) < 0.1 * sigma
+    #evaluating at the bin centres alone is measurably biased
+    centre_model = theano.function([ror], tt.sum(xo.LimbDarkLightCurve(u).get_light_curve(
+        orbit=orbit, r=ror, t=T0 + binned['phase'], texp=TEXP, oversample=7), axis=-1))
+    centres = fit(lambda r: numpy.sum(((binned['flux'] - 1 - centre_model(r)) / binned['error'])**2))
+    assert abs(centres - full) > 3 * abs(fast - full)
@@ -53,4 +53,26 @@ def chisquared_reduced(x, y, error, ymodel):
 
     chisquare = np.sum((y-ymodel)**2/error**2)
     reduced_chisquared = chisquare / (len(x) - 3 -1) # 3 degrees of freedom for the quartic fit hence -3 - 1 
-    return reduced_chisquared
\ No newline at end of file
+    return reduced_chisquared
+
+def binned_light_curve(u, orbit, ror, binned, texp=0.0204, oversample=7):
+    """
+    Transit model averaged over each phase bin, to be compared with the output of TransitFitting.phase_bin.
+    Every bin is evaluated at its sub-phases, each integrated over the exposure time, and then averaged
+    with the sub-bin weights.
+    The times are taken relative to the t0 of the fold, so a shift of the orbit's t0 still moves the model.
+    Folding averages down the correlated noise, so the binned likelihood drops the GP and uses white noise:
+        pm.Normal("obs", mu=mean + binned_light_curve(u, orbit, ror, binned),
+                  sd=tt.sqrt(binned['error']**2 + sigma**2 * binned['jitterweight']), observed=binned['flux'])
+    u: limb darkening coefficients
+    orbit: exoplanet orbit
+    ror: radius ratio
+    binned: output of phase_bin
+    texp: exposure time in days
+    oversample: number of points per exposure
+    returns: model flux per bin, relative to the out of transit level
+    """
+    sub = binned['subphase']
+    t = binned['t0'] + sub.ravel()
+    lc = xo.LimbDarkLightCurve(u).get_light_curve(orbit=orbit, r=ror, t=t, texp=texp, oversample=oversample)
+    return tt.sum(tt.reshape(tt.sum(lc, axis=-1), sub.shape) * binned['subweight'], axis=1)